@@ -14,7 +14,7 @@ except AttributeError:
 __all__ = [
     'get_user_by_username', 'get_friend_usernames', 'get_follower_usernames', 'get_timeline',
     'get_userline', 'get_tweet', 'save_user', 'save_tweet', 'add_friends', 'remove_friend',
-    'DatabaseError', 'NotFound', 'InvalidDictionary', 'PUBLIC_TIMELINE_KEY'
+    'get_write_latency', 'DatabaseError', 'NotFound', 'InvalidDictionary', 'PUBLIC_TIMELINE_KEY'
 ]
 
 # NOTE: Having a single userline key to store all of the public tweets is not
@@ -30,6 +30,11 @@ __all__ = [
 #       the reader.
 PUBLIC_TIMELINE_KEY = '!PUBLIC!'
 
+# A moving average of how long writes are taking, in seconds.  Each new write
+# moves the average this fraction of the way towards its own latency.
+WRITE_LATENCY_WEIGHT = 0.1
+_write_latency = 0.0
+
 
 # EXCEPTIONS
 
@@ -129,13 +134,32 @@ def get_tweet(tweet_id):
     return {'username': row[0], 'body': row[1].decode('utf-8')}
 
 
+def get_write_latency():
+    """
+    Gets the recent average latency of writes made by this process.
+    """
+    return _write_latency
+
+
 # INSERTING APIs
 
+def _write(query, params):
+    """
+    Executes a write, keeping track of how long it took.  Writes that fail
+    count too, since timeouts are what an overloaded cluster produces.
+    """
+    global _write_latency
+    start = time.time()
+    try:
+        cursor.execute(query, params)
+    finally:
+        _write_latency += (time.time() - start - _write_latency) * WRITE_LATENCY_WEIGHT
+
 def save_user(username, password):
     """
     Saves the user record.
     """
-    cursor.execute(
+    _write(
         "UPDATE users SET password = :password WHERE username = :user_id",
         dict(password=password, user_id=username))
 
@@ -150,13 +174,13 @@ def save_tweet(username, body):
     body = body.encode('utf-8')
 
     # Insert the tweet, then into the user's userline, then into the public userline.
-    cursor.execute(
+    _write(
         "INSERT INTO tweets (tweetid, username, body) VALUES (:tweet_id, :username, :body)",
         dict(tweet_id=tweet_id, username=username, body=body))
-    cursor.execute(
+    _write(
         "INSERT INTO userline (username, tweetid, body) VALUES (:username, :posted_at, :body)",
         dict(username=username, posted_at=tweet_id, body=body))
-    cursor.execute(
+    _write(
         """INSERT INTO timeline (username, tweetid, posted_by, body)
            VALUES (:username, :posted_at, :posted_by, :body)""",
         dict(username=PUBLIC_TIMELINE_KEY, posted_at=tweet_id, posted_by=username, body=body))
@@ -164,7 +188,7 @@ def save_tweet(username, body):
     # Get the user's followers, and insert the tweet into all of their streams
     follower_usernames = [username] + get_follower_usernames(username)
     for follower_username in follower_usernames:
-        cursor.execute(
+        _write(
             """INSERT INTO timeline (username, tweetid, posted_by, body)
                VALUES (:username, :posted_at, :posted_by, :body)""",
             dict(username=follower_username, posted_at=tweet_id, posted_by=username, body=body))
@@ -175,10 +199,10 @@ def add_friends(from_username, to_usernames):
     """
     # FIXME: use a BATCH here
     for to_username in to_usernames:
-        cursor.execute(
+        _write(
             "INSERT INTO following (username, followed) VALUES (:from_username, :to_username)",
             dict(from_username=from_username, to_username=to_username))
-        cursor.execute(
+        _write(
             "INSERT INTO followers (username, following) VALUES (:to_username, :from_username)",
             dict(from_username=from_username, to_username=to_username))
 
@@ -187,10 +211,10 @@ def remove_friend(from_username, to_username):
     Removes a friendship relationship from one user to some others.
     """
     # FIXME: use a BATCH here
-    cursor.execute(
+    _write(
         "DELETE FROM following WHERE username = :from_username AND followed = :to_username",
         dict(from_username=from_username, to_username=to_username))
-    cursor.execute(
+    _write(
         "DELETE FROM followers WHERE username = :to_username AND following = :from_username",
         dict(from_username=from_username, to_username=to_username))
 
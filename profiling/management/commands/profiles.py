@@ -0,0 +1,130 @@
+import os
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiling.middleware import PROFILING_DIR
+
+# Samples are bucketed by the first of these with a frame anywhere in the
+# stack, so that a query issued while rendering a template is counted as
+# database time.
+CATEGORIES = (
+    ('db', 'cass.py:'),
+    ('template', 'django/template/'),
+)
+
+def load_capture(capture_id):
+    base = os.path.join(PROFILING_DIR, capture_id)
+    if not os.path.exists(base + '.json'):
+        raise CommandError('No capture named %s in %s' % (capture_id, PROFILING_DIR))
+    f = open(base + '.json')
+    try:
+        summary = json.load(f)
+    finally:
+        f.close()
+    stacks = {}
+    f = open(base + '.folded')
+    try:
+        for line in f:
+            stack, count = line.rsplit(' ', 1)
+            stacks[stack] = int(count)
+    finally:
+        f.close()
+    return summary, stacks
+
+def categorize(stacks):
+    """
+    Returns the fraction of samples spent in each category.
+    """
+    totals = dict((name, 0) for name, _ in CATEGORIES)
+    totals['other'] = 0
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        for name, marker in CATEGORIES:
+            if any(frame.startswith(marker) or ('/' + marker) in frame
+                    for frame in frames):
+                totals[name] += count
+                break
+        else:
+            totals['other'] += count
+    samples = float(sum(totals.values())) or 1.0
+    return dict((name, count / samples) for name, count in totals.items())
+
+def inclusive(stacks):
+    """
+    Returns the fraction of samples in which each frame appears.
+    """
+    counts = {}
+    for stack, count in stacks.items():
+        for frame in set(stack.split(';')):
+            counts[frame] = counts.get(frame, 0) + count
+    samples = float(sum(stacks.values())) or 1.0
+    return dict((frame, count / samples) for frame, count in counts.items())
+
+
+class Command(BaseCommand):
+    args = '[list [count] | show <id> | diff <id> <id>]'
+    help = 'Lists, shows and compares request profiles captured by ProfilingMiddleware.'
+
+    def handle(self, *args, **options):
+        if not args or args[0] == 'list':
+            self.list(*args[1:])
+        elif args[0] == 'show' and len(args) == 2:
+            self.show(args[1])
+        elif args[0] == 'diff' and len(args) == 3:
+            self.diff(args[1], args[2])
+        else:
+            raise CommandError('Usage: %s' % (self.args,))
+
+    def list(self, count=20):
+        try:
+            count = int(count)
+        except ValueError:
+            raise CommandError('Usage: %s' % (self.args,))
+        if not os.path.isdir(PROFILING_DIR):
+            print "No captures in %s" % (PROFILING_DIR,)
+            return
+        ids = sorted([name[:-len('.json')] for name in os.listdir(PROFILING_DIR)
+            if name.endswith('.json')], reverse=True)[:count]
+        for capture_id in ids:
+            summary, stacks = load_capture(capture_id)
+            print "%-24s %6.1fms  db %6.1fms %4d queries  %s %s" % (
+                capture_id, summary['elapsed'] * 1000, summary['db_time'] * 1000,
+                len(summary['calls']), summary['method'], summary['path'])
+
+    def show(self, capture_id):
+        summary, stacks = load_capture(capture_id)
+        print "%s %s  %.1fms, %d samples" % (summary['method'], summary['path'],
+            summary['elapsed'] * 1000, summary['samples'])
+        for name, fraction in sorted(categorize(stacks).items()):
+            print "  %-10s %5.1f%%" % (name, fraction * 100)
+        print
+        for call in summary['calls']:
+            print "  %7.2fms  %-22s %s" % (call['elapsed'] * 1000, call['function'],
+                call['query'])
+
+    def diff(self, old_id, new_id):
+        old_summary, old_stacks = load_capture(old_id)
+        new_summary, new_stacks = load_capture(new_id)
+
+        print "%-10s %10s %10s" % ('', old_id[-8:], new_id[-8:])
+        print "%-10s %8.1fms %8.1fms" % ('elapsed',
+            old_summary['elapsed'] * 1000, new_summary['elapsed'] * 1000)
+        print "%-10s %8.1fms %8.1fms" % ('db',
+            old_summary['db_time'] * 1000, new_summary['db_time'] * 1000)
+        print "%-10s %10d %10d" % ('queries',
+            len(old_summary['calls']), len(new_summary['calls']))
+        old_categories = categorize(old_stacks)
+        new_categories = categorize(new_stacks)
+        for name in sorted(old_categories):
+            print "%-10s %9.1f%% %9.1f%%" % (name,
+                old_categories[name] * 100, new_categories[name] * 100)
+        print
+
+        old_frames = inclusive(old_stacks)
+        new_frames = inclusive(new_stacks)
+        deltas = [(new_frames.get(frame, 0) - old_frames.get(frame, 0), frame)
+            for frame in set(old_frames) | set(new_frames)]
+        deltas.sort(key=lambda delta: -abs(delta[0]))
+        for delta, frame in deltas[:20]:
+            print "  %+6.1f%%  %s" % (delta * 100, frame)
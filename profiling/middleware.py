@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import uuid
+import json
+import random
+import threading
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+import cass
+import throttle
+
+# Settings, with defaults that leave profiling switched off entirely.
+PROFILING_ENABLED = getattr(settings, 'PROFILING_ENABLED', False)
+PROFILING_HEADER = getattr(settings, 'PROFILING_HEADER', 'HTTP_X_PROFILE')
+PROFILING_SECRET = getattr(settings, 'PROFILING_SECRET', None)
+PROFILING_SAMPLE_RATE = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+PROFILING_SLOW_THRESHOLD = getattr(settings, 'PROFILING_SLOW_THRESHOLD', None)
+PROFILING_INTERVAL = getattr(settings, 'PROFILING_INTERVAL', 0.005)
+PROFILING_DIR = getattr(settings, 'PROFILING_DIR',
+    os.path.join(settings.PROJECT_ROOT, 'profiles'))
+PROFILING_MAX_CAPTURES = getattr(settings, 'PROFILING_MAX_CAPTURES', 100)
+
+_local = threading.local()
+
+
+class QueryRecorder(object):
+    """
+    Wraps the cursor in the cass module so that every query made while a
+    request is being profiled is logged, along with the cass function that
+    issued it and how long it took.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, *args, **kwargs):
+        calls = getattr(_local, 'calls', None)
+        if calls is None:
+            return self._cursor.execute(query, *args, **kwargs)
+        # Attribute the query to the public cass function behind it, rather
+        # than to a private helper such as cass._write.
+        frame = sys._getframe(1)
+        while frame.f_code.co_name.startswith('_') and frame.f_back is not None:
+            frame = frame.f_back
+        caller = frame.f_code.co_name
+        start = time.time()
+        try:
+            return self._cursor.execute(query, *args, **kwargs)
+        finally:
+            calls.append({
+                'function': caller,
+                'query': ' '.join(query.split()),
+                'elapsed': time.time() - start,
+            })
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class Sampler(threading.Thread):
+    """
+    A single thread that periodically snapshots the stacks of the threads
+    being profiled, counting each distinct stack so that it can be written
+    out in collapsed form.  It sleeps while nothing is being profiled.
+    """
+    def __init__(self, interval):
+        super(Sampler, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.profiles = {}
+        self._lock = threading.Lock()
+        self._busy = threading.Event()
+
+    def add(self, thread_id):
+        """
+        Starts sampling a thread, returning the dict its stacks go into.
+        """
+        stacks = {}
+        self._lock.acquire()
+        try:
+            self.profiles[thread_id] = stacks
+            self._busy.set()
+        finally:
+            self._lock.release()
+        return stacks
+
+    def remove(self, thread_id):
+        """
+        Stops sampling a thread, returning its stacks, or None if it was not
+        being sampled.
+        """
+        self._lock.acquire()
+        try:
+            stacks = self.profiles.pop(thread_id, None)
+            if not self.profiles:
+                self._busy.clear()
+        finally:
+            self._lock.release()
+        return stacks
+
+    def run(self):
+        while True:
+            self._busy.wait()
+            self._lock.acquire()
+            try:
+                frames = sys._current_frames()
+                for thread_id, stacks in self.profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stack = ';'.join(reversed(list(frame_names(frame))))
+                        stacks[stack] = stacks.get(stack, 0) + 1
+            finally:
+                self._lock.release()
+            del frames
+            time.sleep(self.interval)
+
+_sampler = Sampler(PROFILING_INTERVAL)
+
+
+def frame_names(frame):
+    """
+    Yields a short name for each frame in a stack, innermost first.  Files
+    are named relative to the sys.path entry they were imported from, so
+    Django's frames read as e.g. django/template/base.py:render.
+    """
+    while frame is not None:
+        code = frame.f_code
+        filename = _filenames.get(code.co_filename)
+        if filename is None:
+            filename = _filenames[code.co_filename] = short_filename(code.co_filename)
+        yield '%s:%s' % (filename, code.co_name)
+        frame = frame.f_back
+
+# The sampler names the same few files over and over, so their short names
+# are worked out once and kept here.
+_filenames = {}
+_prefixes = []
+
+def short_filename(filename):
+    if not _prefixes:
+        _prefixes.extend(set(os.path.abspath(path or os.curdir) + os.sep
+            for path in [settings.PROJECT_ROOT] + sys.path))
+    filename = os.path.abspath(filename)
+    best = filename
+    for path in _prefixes:
+        if filename.startswith(path) and len(filename) - len(path) < len(best):
+            best = filename[len(path):]
+    return best
+
+
+class ProfilingMiddleware(object):
+    """
+    Opt-in per-request profiler.  A request is captured when it carries the
+    profiling header (set to PROFILING_SECRET, or from one of INTERNAL_IPS),
+    when it is picked by PROFILING_SAMPLE_RATE, or when it takes longer than
+    PROFILING_SLOW_THRESHOLD seconds.  Each capture writes a collapsed-stack
+    file (suitable for flamegraph.pl) and a JSON summary listing the cass
+    queries made during the request.  Only the newest PROFILING_MAX_CAPTURES
+    captures are kept.
+
+    This should be the first entry in MIDDLEWARE_CLASSES so that it covers
+    the rest of the middleware as well as the view.
+    """
+    def __init__(self):
+        if PROFILING_ENABLED and not isinstance(cass.cursor, QueryRecorder):
+            cass.cursor = QueryRecorder(cass.cursor)
+        if PROFILING_ENABLED and not _sampler.is_alive():
+            _sampler.start()
+
+    def process_request(self, request):
+        # Clean up after a previous request on this thread whose response
+        # never made it back through process_response.
+        _sampler.remove(threading.current_thread().ident)
+        _local.calls = None
+        if not PROFILING_ENABLED:
+            return
+        forced = header_allowed(request) or \
+            random.random() < PROFILING_SAMPLE_RATE
+        if not forced and PROFILING_SLOW_THRESHOLD is None:
+            return
+        request._profiling_forced = forced
+        request._profiling_start = time.time()
+        request._profiling_stacks = _sampler.add(threading.current_thread().ident)
+        _local.calls = []
+
+    def process_exception(self, request, exception):
+        # Stop sampling now, but leave the capture for process_response to
+        # save along with the error response.
+        _sampler.remove(threading.current_thread().ident)
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_profiling_start'):
+            return response
+        _sampler.remove(threading.current_thread().ident)
+        elapsed = time.time() - request._profiling_start
+        calls = _local.calls or []
+        _local.calls = None
+        if request._profiling_forced or elapsed >= PROFILING_SLOW_THRESHOLD:
+            save_capture(request, elapsed, request._profiling_stacks, calls)
+        return response
+
+
+def header_allowed(request):
+    """
+    Whether the request may ask to be profiled with the profiling header.
+    Anyone can send a header, so it is only honoured when it carries the
+    configured secret or comes from one of INTERNAL_IPS.  The client's
+    address is found the same way as for rate limiting, so that behind a
+    proxy it is not the proxy's own address.
+    """
+    value = request.META.get(PROFILING_HEADER)
+    if value is None:
+        return False
+    if PROFILING_SECRET and constant_time_compare(value, PROFILING_SECRET):
+        return True
+    return throttle.client_ip(request) in settings.INTERNAL_IPS
+
+
+def save_capture(request, elapsed, stacks, calls):
+    """
+    Writes out the collapsed stacks and summary for a single request.
+    """
+    if not os.path.isdir(PROFILING_DIR):
+        os.makedirs(PROFILING_DIR)
+    capture_id = '%d-%s' % (time.time(), uuid.uuid4().hex[:8])
+    base = os.path.join(PROFILING_DIR, capture_id)
+
+    f = open(base + '.folded', 'w')
+    try:
+        for stack, count in sorted(stacks.items()):
+            f.write('%s %d\n' % (stack, count))
+    finally:
+        f.close()
+
+    summary = {
+        'id': capture_id,
+        'method': request.method,
+        'path': request.path,
+        'started': request._profiling_start,
+        'elapsed': elapsed,
+        'db_time': sum(call['elapsed'] for call in calls),
+        'samples': sum(stacks.values()),
+        'calls': calls,
+    }
+    f = open(base + '.json', 'w')
+    try:
+        json.dump(summary, f, indent=2)
+    finally:
+        f.close()
+
+    prune_captures()
+
+def prune_captures():
+    """
+    Deletes the oldest captures beyond PROFILING_MAX_CAPTURES.
+    """
+    ids = sorted([name[:-len('.json')] for name in os.listdir(PROFILING_DIR)
+        if name.endswith('.json')], reverse=True)
+    for capture_id in ids[PROFILING_MAX_CAPTURES:]:
+        for ext in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(PROFILING_DIR, capture_id + ext))
+            except OSError:
+                pass
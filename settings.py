@@ -67,6 +67,7 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'profiling.middleware.ProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'users.middleware.UserMiddleware',
@@ -82,10 +83,46 @@ TEMPLATE_DIRS = (
 )
 
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
-CACHE_BACKEND = 'locmem:///'
+CACHE_BACKEND = 'locmem:///'   # Use memcached to share rate limits between processes.
 
 INSTALLED_APPS = (
     'django.contrib.sessions',
     'tweets',
     'users',
+    'profiling',
 )
+
+# Per-request profiling; see profiling/middleware.py.  Captures are written to
+# PROFILING_DIR and can be inspected with `python manage.py profiles`.
+PROFILING_ENABLED = False
+PROFILING_HEADER = 'HTTP_X_PROFILE'     # Requests sending X-Profile are always captured,
+PROFILING_SECRET = None                 # if it is set to this value, or they come from INTERNAL_IPS.
+PROFILING_SAMPLE_RATE = 0.0             # Fraction of requests to capture at random.
+PROFILING_SLOW_THRESHOLD = None         # Capture requests slower than this, in seconds.
+PROFILING_INTERVAL = 0.005              # Seconds between stack samples.
+
+# NOTE: With PROFILING_SLOW_THRESHOLD set, every request has to be sampled in
+#       case it turns out to be slow.  A single thread walks the stack of each
+#       request in flight every PROFILING_INTERVAL, holding the GIL while it
+#       does, so the cost grows with the number of concurrent requests.  In
+#       production, raise PROFILING_INTERVAL (to 0.05, say) when using it.
+PROFILING_DIR = os.path.join(PROJECT_ROOT, 'profiles')
+PROFILING_MAX_CAPTURES = 100            # Older captures are deleted.
+
+# Write rate limits, as (tokens per second, burst size), for each user and
+# for each IP address; see throttle.py.  The IP limits are looser, since many
+# users can share an address behind a NAT or office proxy.
+RATE_LIMITS = {
+    'tweet': {'user': (0.2, 10), 'ip': (2, 100)},
+    'follow': {'user': (0.5, 20), 'ip': (5, 200)},
+}
+
+# Where the rate limiter reads the client's IP address from in request.META.
+# Behind a reverse proxy or load balancer REMOTE_ADDR is the proxy's address,
+# so every user would share a single bucket; set this to the header the
+# proxy fills in instead, e.g. 'HTTP_X_FORWARDED_FOR'.
+RATE_LIMIT_CLIENT_IP = 'REMOTE_ADDR'
+
+# While the average write to Cassandra takes longer than this many seconds,
+# new tweets (which fan out to every follower) are progressively turned away.
+WRITE_LATENCY_THRESHOLD = 0.25
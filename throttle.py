@@ -0,0 +1,106 @@
+import time
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+import cass
+
+__all__ = ['refuse_write', 'take_tokens', 'admit']
+
+# Settings; see settings.py for what they mean.
+RATE_LIMITS = getattr(settings, 'RATE_LIMITS', {})
+RATE_LIMIT_CLIENT_IP = getattr(settings, 'RATE_LIMIT_CLIENT_IP', 'REMOTE_ADDR')
+WRITE_LATENCY_THRESHOLD = getattr(settings, 'WRITE_LATENCY_THRESHOLD', None)
+
+
+# TOKEN BUCKETS
+
+# NOTE: Buckets are read and written back without a lock, so two requests
+#       racing on the same key may both be let through.  That is fine for
+#       catching an account hammering the site in a loop, which is all this
+#       is for.
+#
+#       The buckets are only shared between processes if CACHE_BACKEND is
+#       (memcached, say); with locmem each process keeps its own.
+
+def take_tokens(buckets):
+    """
+    Takes a token from each of the given (key, rate, burst) buckets, where a
+    bucket is stored under its cache key and refills at `rate` tokens a
+    second up to `burst` tokens.  Tokens are only taken if every bucket has
+    one, so a request turned away by one bucket does not drain the others.
+    Returns the number of seconds until all of them have a token, or 0 if
+    the tokens were taken.
+    """
+    now = time.time()
+    levels = []
+    for key, rate, burst in buckets:
+        tokens, last = cache.get(key, (burst, now))
+        levels.append((key, rate, burst, min(burst, tokens + (now - last) * rate)))
+
+    wait = max([(1 - tokens) / rate for key, rate, burst, tokens in levels])
+    if wait > 0:
+        return wait
+
+    for key, rate, burst, tokens in levels:
+        # Once a bucket would have refilled it is the same as a missing one.
+        timeout = int(burst / float(rate)) + 1
+        cache.set(key, (tokens - 1, now), timeout)
+    return 0
+
+def client_ip(request):
+    """
+    Gets the client's address from RATE_LIMIT_CLIENT_IP.  Proxies append
+    to X-Forwarded-For, so the last address is the one the proxy saw.
+    """
+    return request.META.get(RATE_LIMIT_CLIENT_IP, '').split(',')[-1].strip()
+
+
+# ADMISSION CONTROL
+
+def admit():
+    """
+    Decides whether to accept a write that fans out to other users.  While
+    writes are slower than WRITE_LATENCY_THRESHOLD on average, they are let
+    through with a probability that shrinks as latency climbs, so that the
+    cluster is given room to recover while the average keeps being updated.
+    """
+    if WRITE_LATENCY_THRESHOLD is None:
+        return True
+    latency = cass.get_write_latency()
+    if latency <= WRITE_LATENCY_THRESHOLD:
+        return True
+    return random.random() < WRITE_LATENCY_THRESHOLD / latency
+
+
+# VIEWS
+
+def refuse_write(request, action, fanout=False):
+    """
+    Called by a view just before it writes on behalf of the logged-in user.
+    Returns a response turning the request away if the user or their IP
+    address is over the limits configured for the action in RATE_LIMITS, or
+    if fanout is True and the backend is too overloaded to admit it;
+    otherwise returns None and the view should go ahead.
+    """
+    if fanout and not admit():
+        response = HttpResponse('The service is busy, please try again shortly.\n',
+            content_type='text/plain', status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    limits = RATE_LIMITS.get(action, {})
+    names = {'user': request.session['username'], 'ip': client_ip(request)}
+    buckets = [('throttle:%s:%s:%s' % (action, kind, names[kind]), rate, burst)
+        for kind, (rate, burst) in limits.items()]
+    if not buckets:
+        return None
+    wait = take_tokens(buckets)
+    if wait:
+        response = HttpResponse('Too many requests, please slow down.\n',
+            content_type='text/plain', status=429)
+        response['Retry-After'] = str(int(wait) + 1)
+        return response
+    return None
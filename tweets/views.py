@@ -6,12 +6,16 @@ from django.core.urlresolvers import reverse
 from tweets.forms import TweetForm
 
 import cass
+import throttle
 
 NUM_PER_PAGE = 40
 
 def timeline(request):
     form = TweetForm(request.POST or None)
     if request.user['is_authenticated'] and form.is_valid():
+        refused = throttle.refuse_write(request, 'tweet', fanout=True)
+        if refused:
+            return refused
         cass.save_tweet(request.session['username'], form.cleaned_data['body'])
         return HttpResponseRedirect(reverse('timeline'))
     start = request.GET.get('start')
@@ -5,6 +5,7 @@ from django.http import HttpResponseRedirect
 from users.forms import LoginForm, RegistrationForm
 
 import cass
+import throttle
 
 def login(request):
     login_form = LoginForm()
@@ -68,7 +69,11 @@ def modify_friend(request):
     next = request.REQUEST.get('next')
     added = False
     removed = False
-    if request.user['is_authenticated']:
+    if request.user['is_authenticated'] and \
+            ('add-friend' in request.POST or 'remove-friend' in request.POST):
+        refused = throttle.refuse_write(request, 'follow')
+        if refused:
+            return refused
         if 'add-friend' in request.POST:
             cass.add_friends(
                 request.session['username'],